@@ -15,119 +15,240 @@
 # limitations under the License.
 
 import asyncio
-import traceback
-from typing import Any, Dict, List
+import contextlib
+import json
+import logging
+import random
+import re
+from itertools import chain
+from typing import Any, Dict, List, Tuple
 
 import aiohttp
 
-from .config import settings
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except (
+    ImportError
+):  # pragma: no cover - fallback for broken installs; orjson is a dependency
+    _json_loads = json.loads
+
+from .config import (
+    BACKOFF_MAX,
+    BATCH,
+    CHUNK_SIZE,
+    DURABLE,
+    GATEWAY_WS,
+    PIPELINE_DEPTH,
+    SUBJECT,
+)
 from .events import apply_events
 
+__all__ = ["ws_loop"]
+
+log = logging.getLogger(__name__)
+
+# Frame types the agent acts on. Anything else (heartbeats, unknown types)
+# is recognized with a cheap scan and dropped without being deserialized.
+_HANDLED_TYPE = re.compile(r'"type"\s*:\s*"(?:events|error)"')
+
+
+Batch = Tuple[Any, List[Dict[str, Any]]]
+
+
+def _ack_frame(batch_id: Any) -> str:
+    """Encode an ACK frame; integer batch ids skip the JSON encoder."""
+    if type(batch_id) is int:
+        return f'{{"type":"ack","batch":{batch_id}}}'
+    return json.dumps({"type": "ack", "batch": batch_id})
+
+
+async def _writer(ws: aiohttp.ClientWebSocketResponse, work_q: "asyncio.Queue[Batch]"):
+    """
+    Apply queued batches to MySQL in arrival order, ACKing each one only after
+    all of its chunks have committed.
+
+    Runs alongside the frame reader so the socket keeps draining while a batch
+    is being written. On a DB error the socket is closed without ACKing, so
+    JetStream redelivers the failed batch and anything queued behind it.
+    """
+    chunk_size = CHUNK_SIZE
+
+    while True:
+        batch_id, all_events = await work_q.get()
+
+        if all_events:
+            try:
+                # process in smaller DB transactions
+                for i in range(0, len(all_events), chunk_size):
+                    chunk = all_events[i : i + chunk_size]
+                    log.debug(
+                        "applying chunk %d of batch %s: %d events",
+                        i // chunk_size + 1,
+                        batch_id,
+                        len(chunk),
+                    )
+                    await apply_events(chunk)
+
+                log.debug(
+                    "apply_events OK for batch %s (%d events in chunks of %d)",
+                    batch_id,
+                    len(all_events),
+                    chunk_size,
+                )
+            except Exception:
+                log.exception("apply_events error for batch %s", batch_id)
+                # Do NOT ack the batch; let JetStream redeliver
+                await ws.close()
+                return
+
+        # Only ACK after *all* chunks in this WS batch succeeded
+        try:
+            await ws.send_str(_ack_frame(batch_id))
+            log.debug("ACK sent for batch %s", batch_id)
+        except aiohttp.ClientConnectionError as e:
+            log.error("failed to send ACK for batch %s: %s", batch_id, e)
+            raise
+
+
+async def _enqueue(
+    work_q: "asyncio.Queue[Batch]", batch: Batch, writer: "asyncio.Task[None]"
+) -> bool:
+    """
+    Hand `batch` to the writer, waiting while the queue is full. Returns
+    False if the writer stopped first, so the reader never blocks forever.
+    """
+    if writer.done():
+        return False
+
+    put = asyncio.ensure_future(work_q.put(batch))
+    await asyncio.wait((put, writer), return_when=asyncio.FIRST_COMPLETED)
+    if not put.done():
+        put.cancel()
+        return False
+    return True
+
+
+async def _on_text(
+    ws: aiohttp.ClientWebSocketResponse,
+    msg: aiohttp.WSMessage,
+    work_q: "asyncio.Queue[Batch]",
+    writer: "asyncio.Task[None]",
+) -> bool:
+    """Handle a gateway text frame. Returns False to stop reading."""
+    if not _HANDLED_TYPE.search(msg.data):
+        return True
+
+    payload: Dict[str, Any] = _json_loads(msg.data)
+    msg_type = payload.get("type")
+
+    if msg_type == "events":
+        messages: List[Dict[str, Any]] = payload["messages"]
+        all_events: List[Dict[str, Any]] = list(
+            chain.from_iterable(
+                (m.get("data") or {}).get("events") or () for m in messages
+            )
+        )
+        return await _enqueue(work_q, (payload["batch"], all_events), writer)
+
+    if msg_type == "error":
+        # Error from gateway (e.g. JetStream problems)
+        log.error("gateway error: %s", payload.get("message"))
+        return False
+
+    # Unknown message type; ignore for now
+    return True
+
+
+async def _on_close(ws, msg, work_q, writer) -> bool:
+    if msg.type == aiohttp.WSMsgType.CLOSE:
+        log.info("WS CLOSE from server")
+    else:
+        log.info("WS is closing/closed (type=%s)", msg.type)
+    return False
+
+
+async def _on_error(ws, msg, work_q, writer) -> bool:
+    log.warning("WS ERROR: %r", ws.exception())
+    return False
+
+
+# Per-frame dispatch on the WS message type; types not listed are skipped
+_HANDLERS = {
+    aiohttp.WSMsgType.TEXT: _on_text,
+    aiohttp.WSMsgType.CLOSE: _on_close,
+    aiohttp.WSMsgType.CLOSING: _on_close,
+    aiohttp.WSMsgType.CLOSED: _on_close,
+    aiohttp.WSMsgType.ERROR: _on_error,
+}
+
 
 async def ws_loop() -> None:
+    """
+    Consume event batches from the gateway's /stream endpoint forever.
+
+    This is the agent's only entrypoint: it (re)connects with jittered
+    backoff, feeds batches to the MySQL writer and ACKs them once committed.
+    """
     uri = (
-        f"{settings.gateway_ws}/stream"
-        f"?subject={settings.subject}"
-        f"&durable={settings.durable}"
-        f"&batch={settings.batch}"
+        f"{GATEWAY_WS}/stream"
+        f"?subject={SUBJECT}"
+        f"&durable={DURABLE}"
+        f"&batch={BATCH}"
     )
 
     backoff = 1
-
-    while True:
-        try:
-            print(f"[agent-mysql] connecting {uri}")
-
-            # Fresh session per connection attempt
-            async with aiohttp.ClientSession() as sess:
-                async with sess.ws_connect(uri) as ws:
-                    print(f"[agent-mysql] connected {uri}")
-                    payload: Dict[str, Any] = {}
-                    msg_type: str = ""
+    handlers = _HANDLERS
+
+    # One session for the agent's lifetime: reconnects reuse its connector,
+    # DNS cache and TLS context instead of rebuilding them on every attempt.
+    connector = aiohttp.TCPConnector(ttl_dns_cache=300)
+    async with aiohttp.ClientSession(connector=connector) as sess:
+        while True:
+            try:
+                log.info("connecting %s", uri)
+
+                # Heartbeat pings detect a half-open socket in seconds rather
+                # than waiting on TCP keepalives; per-message deflate stays off
+                # since the gateway already batches frames.
+                async with sess.ws_connect(
+                    uri,
+                    heartbeat=20,
+                    autoping=True,
+                    compress=0,
+                    max_msg_size=64 * 1024 * 1024,
+                ) as ws:
+                    log.info("connected %s", uri)
                     backoff = 1
 
-                    async for msg in ws:
-                        if msg.type == aiohttp.WSMsgType.TEXT:
-                            payload = msg.json()
-                            msg_type = payload.get("type")
-                        elif msg.type == aiohttp.WSMsgType.CLOSE:
-                            print("[agent-mysql] WS CLOSE from server")
-                            break
-                        elif msg.type in (
-                            aiohttp.WSMsgType.CLOSING,
-                            aiohttp.WSMsgType.CLOSED,
-                        ):
-                            print(
-                                f"[agent-mysql] WS is closing/closed (type={msg.type})"
-                            )
-                            break
-                        elif msg.type == aiohttp.WSMsgType.ERROR:
-                            print("[agent-mysql] WS ERROR:", repr(ws.exception()))
-                            break
-                        else:
-                            print(f"[agent-mysql] unhandled WS msg type {msg.type}")
-                            continue
-
-                        if msg_type == "events":
-                            batch_id = payload["batch"]
-                            messages: List[Dict[str, Any]] = payload["messages"]
-
-                            all_events: List[Dict[str, Any]] = []
-                            for m in messages:
-                                data = m.get("data") or {}
-                                evs = data.get("events") or []
-                                all_events.extend(evs)
-
-                            if all_events:
-                                try:
-                                    # process in smaller DB transactions
-                                    for i in range(
-                                        0, len(all_events), settings.chunk_size
-                                    ):
-                                        chunk = all_events[i : i + settings.chunk_size]
-                                        print(
-                                            f"[agent-mysql] applying chunk {i//settings.chunk_size + 1} "
-                                            f"of batch {batch_id}: {len(chunk)} events"
-                                        )
-                                        await apply_events(chunk)
-
-                                    print(
-                                        f"[agent-mysql] apply_events OK for batch {batch_id} "
-                                        f"({len(all_events)} events in chunks of {settings.chunk_size})"
-                                    )
-                                except Exception as e:
-                                    print(
-                                        f"[agent-mysql] apply_events error for batch {batch_id}: {e}"
-                                    )
-                                    traceback.print_exc()
-                                    # Do NOT ack the batch; let JetStream redeliver
-                                    break
-
-                            # Only ACK after *all* chunks in this WS batch succeeded
-                            try:
-                                await ws.send_json({"type": "ack", "batch": batch_id})
-                                print(f"[agent-mysql] ACK sent for batch {batch_id}")
-                            except aiohttp.ClientConnectionError as e:
-                                print(
-                                    f"[agent-mysql] failed to send ACK for batch {batch_id}: {e}"
-                                )
-                                raise
-
-                        elif msg_type == "error":
-                            # Error from gateway (e.g. JetStream problems)
-                            print(
-                                f"[agent-mysql] gateway error: {payload.get('message')}"
-                            )
-                            break
-
-                        else:
-                            # Unknown message type; ignore for now
-                            continue
-
-            print("[agent-mysql] websocket closed; will reconnect")
-
-        except Exception as e:
-            print(f"[agent-mysql] WS loop error: {e}; retrying in {backoff}s")
-            traceback.print_exc()
-            await asyncio.sleep(backoff)
-            backoff = min(backoff * 2, 30)
+                    # Bounded so a slow database applies backpressure to the
+                    # reader instead of buffering batches without limit
+                    work_q: "asyncio.Queue[Batch]" = asyncio.Queue(
+                        maxsize=PIPELINE_DEPTH
+                    )
+                    writer = asyncio.create_task(_writer(ws, work_q))
+
+                    try:
+                        async for msg in ws:
+                            handler = handlers.get(msg.type)
+                            if handler is None:
+                                log.debug("unhandled WS msg type %s", msg.type)
+                                continue
+                            if not await handler(ws, msg, work_q, writer):
+                                break
+                    finally:
+                        # Unacked batches still queued are redelivered
+                        writer.cancel()
+                        with contextlib.suppress(asyncio.CancelledError):
+                            await writer
+
+                log.info("websocket closed; will reconnect")
+
+            except Exception as e:
+                # Full jitter so agents don't reconnect in lockstep after a
+                # gateway restart
+                delay = random.uniform(0, backoff)
+                log.exception("WS loop error: %s; retrying in %.1fs", e, delay)
+                await asyncio.sleep(delay)
+                backoff = min(backoff * 2, BACKOFF_MAX)
@@ -15,10 +15,13 @@
 # limitations under the License.
 
 import os
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class Settings(BaseModel):
+    # Read once at startup; nothing mutates settings at runtime
+    model_config = ConfigDict(frozen=True)
+
     # Gateway WebSocket endpoint
     gateway_ws: str = os.getenv("GATEWAY_WS", "ws://localhost:8000")
 
@@ -28,6 +31,20 @@ class Settings(BaseModel):
     batch: int = int(os.getenv("SNAPFS_BATCH", "5"))
     chunk_size: int = int(os.getenv("SNAPFS_CHUNK_SIZE", "200"))
 
+    # Batches buffered between the WS reader and the DB writer
+    pipeline_depth: int = int(os.getenv("SNAPFS_PIPELINE_DEPTH", "4"))
+
+    # Reconnect backoff ceiling (seconds)
+    backoff_max: int = int(os.getenv("SNAPFS_BACKOFF_MAX", "30"))
+
+    # Logging level for the agent process (DEBUG logs every batch)
+    log_level: str = os.getenv("SNAPFS_LOG_LEVEL", "INFO")
+
+    # Connections kept open per engine; overflow connections are extra,
+    # short-lived ones opened under burst load
+    db_pool_size: int = int(os.getenv("SNAPFS_DB_POOL_SIZE", "10"))
+    db_max_overflow: int = int(os.getenv("SNAPFS_DB_MAX_OVERFLOW", "10"))
+
     # Async SQLAlchemy URL using aiomysql driver
     mysql_url: str = os.getenv(
         "MYSQL_URL",
@@ -36,3 +53,15 @@ class Settings(BaseModel):
 
 
 settings = Settings()
+
+# Plain module constants for hot paths, avoiding attribute lookups on the model
+GATEWAY_WS = settings.gateway_ws
+SUBJECT = settings.subject
+DURABLE = settings.durable
+BATCH = settings.batch
+CHUNK_SIZE = settings.chunk_size
+PIPELINE_DEPTH = settings.pipeline_depth
+BACKOFF_MAX = settings.backoff_max
+DB_POOL_SIZE = settings.db_pool_size
+DB_MAX_OVERFLOW = settings.db_max_overflow
+MYSQL_URL = settings.mysql_url
@@ -14,21 +14,42 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from sqlalchemy import text
+import logging
+from typing import Any, Dict
+
+from sqlalchemy import Engine, UniqueConstraint, create_engine, inspect, make_url, text
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
+from sqlalchemy.orm import sessionmaker
 
-from .config import settings
+from .config import DB_MAX_OVERFLOW, DB_POOL_SIZE, MYSQL_URL
 
+log = logging.getLogger(__name__)
 
-engine: AsyncEngine = create_async_engine(
-    settings.mysql_url,
+_ENGINE_OPTIONS: Dict[str, Any] = dict(
     pool_pre_ping=True,
+    # Room for pipelined batches; recycle well inside MySQL's wait_timeout
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_recycle=1800,
+    # Reuse the most recently returned connection so idle ones age out and
+    # the busy few stay warm
+    pool_use_lifo=True,
+    pool_reset_on_return="rollback",
+    # Ingest reuses a handful of statement shapes; keep them all compiled
+    query_cache_size=1200,
+    connect_args={"charset": "utf8mb4"},
+)
+
+
+engine: AsyncEngine = create_async_engine(
+    MYSQL_URL,
     future=True,
+    **_ENGINE_OPTIONS,
 )
 
 SessionLocal = async_sessionmaker(
@@ -37,6 +58,62 @@ SessionLocal = async_sessionmaker(
     class_=AsyncSession,
 )
 
+# Blocking twin of `engine` for bulk ingest, which runs in a worker thread:
+# one big upsert per table is cheaper as a plain blocking call than as a
+# series of awaited aiomysql cursor operations.
+sync_engine: Engine = create_engine(
+    make_url(MYSQL_URL).set(drivername="mysql+pymysql"),
+    **_ENGINE_OPTIONS,
+)
+
+SyncSessionLocal = sessionmaker(bind=sync_engine, expire_on_commit=False)
+
+
+def get_engine() -> Engine:
+    """Return the synchronous engine (CLI tooling, ad-hoc queries, ingest)."""
+    return sync_engine
+
+
+def _check_unique_keys(conn, metadata) -> None:
+    """
+    Warn about unique keys declared in the models but missing from the live
+    schema. create_all() never alters existing tables, and the bulk upserts
+    rely on these keys to resolve ON DUPLICATE KEY; without them they insert
+    duplicates instead.
+    """
+    insp = inspect(conn)
+    for table in metadata.sorted_tables:
+        expected = {ix.name for ix in table.indexes if ix.unique}
+        expected |= {
+            c.name for c in table.constraints if isinstance(c, UniqueConstraint)
+        }
+        present = {ix["name"] for ix in insp.get_indexes(table.name) if ix["unique"]}
+        present |= {uc["name"] for uc in insp.get_unique_constraints(table.name)}
+        for name in sorted(expected - present):
+            log.warning("table %s is missing unique key %s", table.name, name)
+
+
+def _check_columns(conn, metadata) -> None:
+    """
+    Fail if a table lacks columns the models declare. create_all() never
+    alters existing tables, and ingest writes every mapped column, so a
+    schema from an older release would fail each batch with "Unknown
+    column"; better to refuse to start until it has been migrated.
+    """
+    insp = inspect(conn)
+    missing = []
+    for table in metadata.sorted_tables:
+        present = {col["name"] for col in insp.get_columns(table.name)}
+        missing += [
+            f"{table.name}.{col.name}"
+            for col in table.columns
+            if col.name not in present
+        ]
+    if missing:
+        raise RuntimeError(
+            "database schema is out of date, missing columns: " + ", ".join(missing)
+        )
+
 
 async def init_db(Base) -> None:
     """
@@ -46,14 +123,21 @@ async def init_db(Base) -> None:
     async with engine.begin() as conn:
         # Create concrete tables
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_check_columns, Base.metadata)
+        await conn.run_sync(_check_unique_keys, Base.metadata)
 
-        # Create file_cache view for gateway lookups
+        # Create file_cache view for gateway lookups. full_path itself is not
+        # indexed: look rows up with
+        #   WHERE path_hash = :h AND path = :path
+        # where :h is models.path_hash(path), so MySQL can use
+        # uq_paths_full_path_hash instead of scanning paths.
         await conn.execute(
             text(
                 """
                 CREATE OR REPLACE VIEW file_cache AS
                 SELECT
                     p.full_path AS path,
+                    p.full_path_hash AS path_hash,
                     c.algo,
                     c.hash,
                     c.size AS size,
@@ -14,11 +14,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import traceback
-from typing import Any, Dict, Iterable
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, List
 
-from .db import SessionLocal
-from .ingest import ingest_file_event
+from sqlalchemy.exc import IntegrityError
+
+from .db import SyncSessionLocal
+from .ingest import clear_content_id_cache, ingest_file_events
+
+log = logging.getLogger(__name__)
 
 
 async def apply_events(events: Iterable[Dict[str, Any]]) -> None:
@@ -30,32 +35,41 @@ async def apply_events(events: Iterable[Dict[str, Any]]) -> None:
         { "type": "file.upsert", "data": { ... file metadata ... } }
 
     For now we only handle file.upsert; other event types are ignored.
+    The whole batch is written with a handful of bulk statements in a single
+    transaction, so a database error fails (and redelivers) the batch. The
+    blocking DB work runs in a worker thread to keep the event loop free.
     """
     events = list(events)
-    print(f"[agent-mysql] applying {len(events)} events in DB transaction")
-    async with SessionLocal() as session:
-        async with session.begin():
-            for ev in events:
-                if ev.get("type") != "file.upsert":
-                    continue
-
-                data = ev.get("data") or {}
-                path = data.get("path")
-                if not path:
-                    print("[agent-mysql] skipping file.upsert event with no path")
-                    continue
-
-                # Delegate to the synchronous ingest logic using run_sync.
-                # run_sync will provide a sync Session bound to the same connection.
-                def _sync_ingest(sync_session):
-                    try:
-                        ingest_file_event(sync_session, data)
-                    except Exception as e:
-                        print(
-                            f"[agent-mysql] error ingesting file event for path {path}: {e}"
-                        )
-                        traceback.print_exc()
-
-                await session.run_sync(_sync_ingest)
-
-        # session.commit() is implicit via session.begin()
+    log.debug("applying %d events in DB transaction", len(events))
+
+    # Only the last event per path matters; collapse repeats before the DB
+    latest: Dict[str, Dict[str, Any]] = {}
+    for ev in events:
+        if ev.get("type") != "file.upsert":
+            continue
+
+        data = ev.get("data") or {}
+        if not data.get("path"):
+            log.warning("skipping file.upsert event with no path")
+            continue
+
+        latest[data["path"]] = data
+
+    if not latest:
+        return
+
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, _apply_sync, list(latest.values()))
+
+
+def _apply_sync(rows: List[Dict[str, Any]]) -> None:
+    try:
+        with SyncSessionLocal.begin() as session:
+            ingest_file_events(session, rows)
+    except IntegrityError:
+        # Most likely a cached content id whose row is gone (restore,
+        # truncate); drop the cache so the redelivered batch re-resolves.
+        clear_content_id_cache()
+        raise
+
+    # session.commit() is implicit via SyncSessionLocal.begin()
@@ -14,11 +14,61 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import Any, Dict, Optional
-
+import logging
+import threading
+from collections import OrderedDict
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from sqlalchemy import Table, func, select, tuple_
+from sqlalchemy.dialects.mysql import Insert
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 from sqlalchemy.orm import Session
 
-from .models import Content, File, PathEntry, Snapshot, SnapshotFile
+from .models import (
+    FILE_TYPES,
+    HASH_ALGOS,
+    Content,
+    File,
+    PathEntry,
+    Snapshot,
+    SnapshotFile,
+    content_fingerprint,
+    path_hash,
+)
+
+log = logging.getLogger(__name__)
+
+# Optional File attributes. An event that omits one leaves the stored value
+# untouched. Values are bound as-is; the column types coerce them.
+_FILE_OPTIONAL_COLS: Tuple[str, ...] = (
+    "nlinks",
+    "atime",
+    "ctime",
+    "owner",
+    "group",
+    "uid",
+    "gid",
+    "mode",
+)
+
+# Process-local LRU of content fingerprint -> id, so content seen in earlier
+# batches skips the database entirely. Only ids read back from
+# already-committed rows are cached, never ones inserted by the running
+# transaction, which could still roll back. Content rows are not deleted by
+# the agent, but a restored or truncated database can invalidate entries;
+# events._apply_sync clears the cache when a batch hits an IntegrityError.
+# Ingest runs in executor threads that can overlap, hence the lock.
+_CONTENT_ID_CACHE_SIZE = 1 << 18
+_content_id_cache: "OrderedDict[int, int]" = OrderedDict()
+_content_id_lock = threading.Lock()
 
 
 def _split_path(path: str) -> tuple[str, str]:
@@ -39,12 +89,24 @@ def _split_path(path: str) -> tuple[str, str]:
         # No directory component; treat everything as the name
         return "/", norm
 
-    dir_, name = norm.rsplit("/", 1)
+    dir_, _, name = norm.rpartition("/")
 
     if not dir_:
         dir_ = "/"
 
-    return dir_, name or ""
+    return dir_, name
+
+
+def _event_dir_name(data: Dict[str, Any], path: str) -> Tuple[str, str]:
+    """
+    Return (dir, name) for an event, trusting the scanner's own `dir` and
+    `name` fields when both are present and splitting `path` otherwise.
+    """
+    dir_ = data.get("dir")
+    name = data.get("name")
+    if dir_ and name:
+        return dir_, name
+    return _split_path(path)
 
 
 def _split_ext(name: str) -> Optional[str]:
@@ -61,7 +123,7 @@ def _split_ext(name: str) -> Optional[str]:
         return None
 
     # Make sure we only deal with the last path segment, defensively
-    basename = name.replace("\\", "/").split("/")[-1]
+    basename = name.replace("\\", "/").rpartition("/")[2]
 
     # Pure dotfile ('.git', '.gitignore') → no extension
     if basename.startswith(".") and basename.count(".") == 1:
@@ -75,143 +137,407 @@ def _split_ext(name: str) -> Optional[str]:
     return basename[idx + 1 :]
 
 
-def _get_or_create_content(
-    session: Session,
-    algo: Optional[str],
-    hash_: Optional[str],
-    size: Optional[int],
-) -> Optional[Content]:
-    """Get or create a Content object by (algo, hash, size)."""
-    if not algo or not hash_ or size is None:
+def _file_type(value: Optional[str]) -> str:
+    """Map a scanner file type onto the files.type ENUM ("file" if missing)."""
+    if not value:
+        return "file"
+    return value if value in FILE_TYPES else "unknown"
+
+
+def _event_algo(data: Dict[str, Any]) -> Optional[str]:
+    """
+    Return the event's hash algorithm, or None if it has none or it is not
+    one content.algo can store; such events are ingested without content.
+    """
+    algo = data.get("algo")
+    if algo and algo not in HASH_ALGOS:
+        log.warning(
+            "unsupported hash algo %r for path %s, ignoring hash",
+            algo,
+            data.get("path"),
+        )
         return None
+    return algo
+
+
+def _cached_content_ids(fps: Iterable[int]) -> Dict[int, int]:
+    """Return the cached ids among `fps`, marking them recently used."""
+    hits: Dict[int, int] = {}
+    with _content_id_lock:
+        for fp in fps:
+            content_id = _content_id_cache.get(fp)
+            if content_id is not None:
+                _content_id_cache.move_to_end(fp)
+                hits[fp] = content_id
+    return hits
+
+
+def _cache_content_ids(ids: Dict[int, int]) -> None:
+    with _content_id_lock:
+        _content_id_cache.update(ids)
+        while len(_content_id_cache) > _CONTENT_ID_CACHE_SIZE:
+            _content_id_cache.popitem(last=False)
+
+
+def clear_content_id_cache() -> None:
+    """Forget all cached content ids, e.g. after a foreign-key failure."""
+    with _content_id_lock:
+        _content_id_cache.clear()
+
+
+def _upsert(
+    table: Table,
+    update_cols: Sequence[str],
+    keep_existing: Sequence[str] = (),
+    noop_key: str = "id",
+) -> Insert:
+    """
+    Build an INSERT ... ON DUPLICATE KEY UPDATE for `table`.
+
+    On conflict the `update_cols` are overwritten with the incoming value;
+    those also listed in `keep_existing` keep their stored value when the
+    incoming one is NULL. With no `update_cols` the conflict is a no-op on
+    `noop_key`. Timestamps are maintained by MySQL.
+
+    The statements are built once at import and executed with a list of row
+    dicts, so SQLAlchemy compiles each one a single time and PyMySQL folds
+    the executemany into multi-row INSERTs.
+    """
+    stmt = mysql_insert(table)
+    values: Dict[str, Any] = {}
+    for name in update_cols:
+        if name in keep_existing:
+            values[name] = func.coalesce(stmt.inserted[name], table.c[name])
+        else:
+            values[name] = stmt.inserted[name]
+    if not values:
+        values[noop_key] = table.c[noop_key]
+    return stmt.on_duplicate_key_update(values)
+
+
+# Content rows never change once written
+_CONTENT_INSERT = _upsert(Content.__table__, (), noop_key="content_fp")
+_FILE_UPSERT = _upsert(
+    File.__table__,
+    ("content_id", "mtime", "type") + _FILE_OPTIONAL_COLS,
+    keep_existing=_FILE_OPTIONAL_COLS,
+)
+# For events without a type: new rows get the "file" default from
+# _file_row, existing rows keep their stored type.
+_FILE_UPSERT_KEEP_TYPE = _upsert(
+    File.__table__,
+    ("content_id", "mtime") + _FILE_OPTIONAL_COLS,
+    keep_existing=_FILE_OPTIONAL_COLS,
+)
+_PATH_UPSERT = _upsert(
+    PathEntry.__table__,
+    ("file_id", "dir", "name", "ext", "is_deleted"),
+)
+# Keyed on uq_snapshot_files_snapshot_path
+_SNAPSHOT_FILE_UPSERT = _upsert(SnapshotFile.__table__, ("file_id", "size_bytes"))
+
+
+def _resolve_ids(
+    session: Session,
+    table: Table,
+    keys: Sequence[str],
+    values: Iterable[Any],
+    locking: bool = False,
+) -> Dict[Any, int]:
+    """
+    Map natural keys to row ids with a single IN (...) SELECT. Composite
+    keys are given and returned as tuples, single-column keys as scalars.
 
-    size = int(size)
+    Use `locking` right after an upsert: a plain SELECT reads the
+    transaction's REPEATABLE READ snapshot, which misses rows a concurrent
+    transaction inserted that our upsert then left untouched. A locking
+    read (LOCK IN SHARE MODE) always sees the latest committed rows.
+    """
+    values = list(values)
+    if not values:
+        return {}
 
-    content = (
-        session.query(Content).filter_by(algo=algo, hash=hash_, size=size).one_or_none()
+    key_cols = [table.c[k] for k in keys]
+    if len(keys) == 1:
+        stmt = select(table.c.id, *key_cols).where(key_cols[0].in_(values))
+    else:
+        stmt = select(table.c.id, *key_cols).where(tuple_(*key_cols).in_(values))
+    if locking:
+        stmt = stmt.with_for_update(read=True)
+
+    result = session.execute(stmt)
+    if len(keys) == 1:
+        return {key: id_ for id_, key in result}
+    return {tuple(row[1:]): row[0] for row in result}
+
+
+def _content_identity(row: Dict[str, Any]) -> Tuple[str, str, int]:
+    """(algo, hash, size) of a content row; hex digests compare case-insensitively."""
+    return row["algo"], row["hash"].lower(), row["size"]
+
+
+def _content_collision(fp: int, stored: Dict[str, Any], row: Dict[str, Any]) -> None:
+    log.error(
+        "content fingerprint %d collides: %s:%s/%d vs event %s:%s/%d;"
+        " ingesting without content",
+        fp,
+        stored["algo"],
+        stored["hash"],
+        stored["size"],
+        row["algo"],
+        row["hash"],
+        row["size"],
     )
-    if content is None:
-        content = Content(algo=algo, hash=hash_, size=size)
-        session.add(content)
-    return content
 
 
-def _get_or_create_file(
+def _resolve_content_ids(
     session: Session,
-    dev: int,
-    inode: int,
-) -> File:
-    """Get or create a File object by (dev, inode)."""
-    file = session.query(File).filter_by(dev=dev, inode=inode).one_or_none()
-    if file is None:
-        file = File(dev=dev, inode=inode)
-        session.add(file)
-    return file
-
-
-def _get_or_create_path(
+    content_rows: Dict[int, Dict[str, Any]],
+    fps: Sequence[int],
+    locking: bool = False,
+) -> Dict[int, Optional[int]]:
+    """
+    Map content fingerprints to ids like _resolve_ids, checking each stored
+    row's (algo, hash, size) against the batch row. A fingerprint collision
+    maps to None and is logged, rather than linking files to another
+    content's hash.
+    """
+    table = Content.__table__
+    stmt = select(
+        table.c.id, table.c.content_fp, table.c.algo, table.c.hash, table.c.size
+    ).where(table.c.content_fp.in_(fps))
+    if locking:
+        stmt = stmt.with_for_update(read=True)
+
+    ids: Dict[int, Optional[int]] = {}
+    for id_, fp, algo, hash_, size in session.execute(stmt):
+        row = content_rows[fp]
+        stored = {"algo": algo, "hash": hash_, "size": size}
+        if _content_identity(stored) == _content_identity(row):
+            ids[fp] = id_
+        else:
+            _content_collision(fp, stored, row)
+            ids[fp] = None
+    return ids
+
+
+def _path_hash_collisions(
     session: Session,
-    full_path: str,
-    file: File,
-    is_deleted: bool = False,
-) -> PathEntry:
-    """Get or create a PathEntry by full_path."""
-    dir_, name = _split_path(full_path)
-    ext = _split_ext(name)
-
-    path = session.query(PathEntry).filter_by(full_path=full_path).one_or_none()
-    if path is None:
-        path = PathEntry(
-            full_path=full_path,
-            dir=dir_,
-            name=name,
-            ext=ext,
-            file=file,
-            is_deleted=is_deleted,
+    path_rows: Dict[str, Dict[str, Any]],
+) -> Set[str]:
+    """
+    Return the batch paths whose full_path_hash already belongs to another
+    path, stored or earlier in the batch. Upserting them would repoint that
+    path's row (file_id, dir, name) while leaving its full_path in place.
+    """
+    by_hash: Dict[int, str] = {}
+    colliding: Set[str] = set()
+    for path, row in path_rows.items():
+        if by_hash.setdefault(row["full_path_hash"], path) != path:
+            colliding.add(path)
+
+    table = PathEntry.__table__
+    result = session.execute(
+        select(table.c.full_path_hash, table.c.full_path).where(
+            table.c.full_path_hash.in_(by_hash)
         )
-        session.add(path)
-    else:
-        path.file = file
-        path.dir = dir_
-        path.name = name
-        path.ext = ext
-        path.is_deleted = is_deleted
+    )
+    for hash_, stored in result:
+        if stored != by_hash[hash_]:
+            colliding.add(by_hash[hash_])
+
+    for path in colliding:
+        log.error(
+            "path hash %d collides with another path; skipping %s",
+            path_rows[path]["full_path_hash"],
+            path,
+        )
+    return colliding
 
-    return path
+
+def _file_row(data: Dict[str, Any], dev: int, inode: int) -> Dict[str, Any]:
+    """
+    Map an event onto a `files` insert row. content_id is filled in by the
+    caller once content ids are resolved. A missing type becomes "file",
+    which only applies to new rows (see _FILE_UPSERT_KEEP_TYPE).
+    """
+    row = {col: data.get(col) for col in _FILE_OPTIONAL_COLS}
+    row.update(
+        dev=dev,
+        inode=inode,
+        content_id=None,
+        mtime=data.get("mtime") or 0.0,
+        type=_file_type(data.get("type")),
+    )
+    return row
 
 
-def ingest_file_event(
+def _path_row(data: Dict[str, Any], path: str) -> Dict[str, Any]:
+    """
+    Map an event onto a `paths` insert row. file_id is filled in by the
+    caller once file ids are resolved.
+    """
+    dir_, name = _event_dir_name(data, path)
+    return {
+        "file_id": None,
+        "full_path": path,
+        "full_path_hash": path_hash(path),
+        "dir": dir_,
+        "name": name,
+        "ext": _split_ext(name),
+        "is_deleted": bool(data.get("is_deleted") or False),
+    }
+
+
+def ingest_file_events(
     session: Session,
-    data: Dict[str, Any],
+    events: Iterable[Dict[str, Any]],
     snapshot: Optional[Snapshot] = None,
-) -> File:
+) -> int:
     """
-    Normalize a file.upsert event into Content / File / PathEntry (+ SnapshotFile).
-
-    `data` is expected to be the scanner event payload with at least:
-        path, size, mtime, dev, inode, algo, hash, type, etc.
+    Bulk-normalize a batch of file.upsert payloads into Content / File / PathEntry
+    (+ SnapshotFile membership of the non-deleted paths when `snapshot` is given).
+
+    Each table is written with one multi-row INSERT ... ON DUPLICATE KEY UPDATE,
+    and the ids the next table references are resolved with one IN (...)
+    SELECT, so a batch costs a fixed number of round-trips regardless of its
+    size. Existing content is served from a process-local cache or prefetched,
+    so already-known hashes are not rewritten.
+
+    Events with a non-numeric dev, inode or size, and paths whose 64-bit hash
+    collides with another path, are logged and skipped. Returns the number of
+    paths written.
     """
-    path = data.get("path") or ""
-    dev = int(data.get("dev") or 0)
-    inode = int(data.get("inode") or 0)
-    size = int(data.get("size") or 0)
+    # Keyed by natural key (content by fingerprint) so repeats within a
+    # batch collapse to a single row each; the last event for a key wins,
+    # except that file rows keep earlier values for fields it omits.
+    content_rows: Dict[int, Dict[str, Any]] = {}
+    file_rows: Dict[Tuple[int, int], Dict[str, Any]] = {}
+    path_rows: Dict[str, Dict[str, Any]] = {}
+
+    # Foreign keys are filled in once the referenced ids are known
+    file_content: Dict[Tuple[int, int], Optional[int]] = {}
+    path_file: Dict[str, Tuple[int, int]] = {}
+    path_size: Dict[str, int] = {}
+    # Files none of whose events carried a type
+    untyped: Set[Tuple[int, int]] = set()
+
+    for data in events:
+        path = data.get("path") or ""
+        # Natural-key columns are still coerced: they are matched against the
+        # ints MySQL returns when resolving ids.
+        try:
+            dev = int(data.get("dev") or 0)
+            inode = int(data.get("inode") or 0)
+            size = int(data.get("size") or 0)
+        except (TypeError, ValueError) as e:
+            log.warning("error ingesting file event for path %s: %s", path, e)
+            continue
+
+        algo = _event_algo(data)
+        hash_ = data.get("hash")
+        content_key = content_fingerprint(hash_, size) if algo and hash_ else None
+
+        file_key = (dev, inode)
+        if content_key is not None:
+            content_row = {
+                "algo": algo,
+                "hash": hash_,
+                "size": size,
+                "content_fp": content_key,
+            }
+            prev_content = content_rows.setdefault(content_key, content_row)
+            # A different hash with the same fingerprint earlier in the batch:
+            # the first one keeps the key, this file goes without content.
+            if _content_identity(prev_content) != _content_identity(content_row):
+                _content_collision(content_key, prev_content, content_row)
+                content_key = None
+        row = _file_row(data, dev, inode)
+        prev = file_rows.get(file_key)
+        if prev is not None:
+            # Repeats of an inode (hard links, re-scans) merge: fields a later
+            # event omits keep the value an earlier one carried.
+            for col in _FILE_OPTIONAL_COLS:
+                if row[col] is None:
+                    row[col] = prev[col]
+            if not data.get("type"):
+                row["type"] = prev["type"]
+        file_rows[file_key] = row
+        file_content[file_key] = content_key
+        if data.get("type"):
+            untyped.discard(file_key)
+        elif prev is None:
+            untyped.add(file_key)
+
+        path_rows[path] = _path_row(data, path)
+        path_file[path] = file_key
+        path_size[path] = size
+
+    if not path_rows:
+        return 0
+
+    # 1) Logical content. Content rows never change once written, so only
+    # the keys neither the cache nor the prefetch found need inserting.
+    content_ids: Dict[int, Optional[int]] = {}
+    content_ids.update(_cached_content_ids(content_rows))
+    unseen = [k for k in content_rows if k not in content_ids]
+    if unseen:
+        found = _resolve_content_ids(session, content_rows, unseen)
+        _cache_content_ids({k: v for k, v in found.items() if v is not None})
+        content_ids.update(found)
+    missing = [k for k in unseen if k not in content_ids]
+    if missing:
+        session.execute(_CONTENT_INSERT, [content_rows[k] for k in missing])
+        content_ids.update(
+            _resolve_content_ids(session, content_rows, missing, locking=True)
+        )
 
-    algo = data.get("algo")
-    hash_ = data.get("hash")
-
-    # 1) Logical content
-    content = _get_or_create_content(session, algo, hash_, size)
-
-    # 2) Physical file
-    file = _get_or_create_file(session, dev=dev, inode=inode)
-
-    file.content = content
-    if data.get("nlinks") is not None:
-        file.nlinks = int(data["nlinks"])
-    file.mtime = float(data.get("mtime") or 0.0)
-    if data.get("atime") is not None:
-        file.atime = float(data["atime"])
-    if data.get("ctime") is not None:
-        file.ctime = float(data["ctime"])
-
-    if data.get("owner") is not None:
-        file.owner = data["owner"]
-    if data.get("group") is not None:
-        file.group = data["group"]
-    if data.get("uid") is not None:
-        file.uid = int(data["uid"])
-    if data.get("gid") is not None:
-        file.gid = int(data["gid"])
-    if data.get("mode") is not None:
-        file.mode = int(data["mode"])
-    file.type = data.get("type") or file.type or "file"
-
-    # 3) Path entry
-    is_deleted = bool(data.get("is_deleted") or False)
-    path_entry = _get_or_create_path(
-        session,
-        full_path=path,
-        file=file,
-        is_deleted=is_deleted,
+    # 2) Physical files
+    for file_key, row in file_rows.items():
+        content_key = file_content[file_key]
+        row["content_id"] = (
+            content_ids.get(content_key) if content_key is not None else None
+        )
+
+    file_table = File.__table__
+    typed_rows = [row for key, row in file_rows.items() if key not in untyped]
+    if typed_rows:
+        session.execute(_FILE_UPSERT, typed_rows)
+    if untyped:
+        session.execute(_FILE_UPSERT_KEEP_TYPE, [file_rows[k] for k in untyped])
+    file_ids = _resolve_ids(
+        session, file_table, ("dev", "inode"), file_rows, locking=True
     )
 
+    # 3) Path entries
+    for path in _path_hash_collisions(session, path_rows):
+        del path_rows[path]
+    for path, row in path_rows.items():
+        row["file_id"] = file_ids[path_file[path]]
+
+    if path_rows:
+        session.execute(_PATH_UPSERT, list(path_rows.values()))
+
     # 4) Snapshot membership (optional)
-    if snapshot is not None and not is_deleted:
-        sf = (
-            session.query(SnapshotFile)
-            .filter_by(snapshot_id=snapshot.id, path_id=path_entry.id)
-            .one_or_none()
+    if snapshot is not None:
+        members = {
+            row["full_path_hash"]: path
+            for path, row in path_rows.items()
+            if not row["is_deleted"]
+        }
+        path_ids = _resolve_ids(
+            session, PathEntry.__table__, ("full_path_hash",), members, locking=True
         )
-        if sf is None:
-            sf = SnapshotFile(
-                snapshot=snapshot,
-                file=file,
-                path=path_entry,
-                size_bytes=size,
-            )
-            session.add(sf)
-        else:
-            sf.file = file
-            sf.size_bytes = size
-
-    return file
+        member_rows = [
+            {
+                "snapshot_id": snapshot.id,
+                "path_id": path_id,
+                "file_id": path_rows[members[hash_]]["file_id"],
+                "size_bytes": path_size[members[hash_]],
+            }
+            for hash_, path_id in path_ids.items()
+        ]
+        if member_rows:
+            session.execute(_SNAPSHOT_FILE_UPSERT, member_rows)
+
+    return len(path_rows)
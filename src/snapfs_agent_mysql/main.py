@@ -15,12 +15,36 @@
 # limitations under the License.
 
 import asyncio
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 
+from .config import settings
 from .db import init_db
 from .models import Base
 from .agent import ws_loop
 
 
+def setup_logging() -> QueueListener:
+    """
+    Route log records through a queue so formatting and stderr writes happen
+    on a listener thread instead of the event loop.
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(
+        logging.Formatter("%(asctime)s [agent-mysql] %(levelname)s %(message)s")
+    )
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(settings.log_level.upper())
+
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    return listener
+
+
 async def run():
     # TODO: Bootstrap schema (for PoC/dev). Later: migrate with Alembic instead.
     await init_db(Base)
@@ -28,7 +52,11 @@ async def run():
 
 
 def main():
-    asyncio.run(run())
+    listener = setup_logging()
+    try:
+        asyncio.run(run())
+    finally:
+        listener.stop()
 
 
 if __name__ == "__main__":
@@ -16,23 +16,69 @@
 
 from __future__ import annotations
 
+from datetime import datetime
 from typing import Optional
 
-import time
+import hashlib
 
 from sqlalchemy import (
     BigInteger,
     Boolean,
     Float,
+    FetchedValue,
     ForeignKey,
     Index,
     Integer,
     String,
     Text,
     UniqueConstraint,
+    event,
+    inspect,
+    text,
 )
+from sqlalchemy.dialects.mysql import BIGINT, ENUM, INTEGER, SMALLINT, TIMESTAMP
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
+# Row timestamps are stamped by MySQL, so inserts and upserts don't carry them
+_NOW = text("CURRENT_TIMESTAMP(6)")
+_NOW_ON_UPDATE = text("CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)")
+
+# Low-cardinality labels are stored as 1-byte ENUMs. Ingest maps anything
+# outside these sets before writing, see ingest._file_type/_event_algo.
+FILE_TYPES = ("file", "dir", "symlink", "fifo", "sock", "char", "block", "unknown")
+HASH_ALGOS = ("sha256", "sha1", "blake3", "md5", "xxh64")
+
+
+def path_hash(full_path: str) -> int:
+    """
+    64-bit (signed) hash of a full path, used as the unique key for paths.
+
+    Indexing this instead of a long TEXT prefix keeps the index small and
+    makes upsert conflict checks a single BIGINT compare.
+    """
+    digest = hashlib.blake2b(
+        full_path.encode("utf-8", "surrogatepass"), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def content_fingerprint(hash_: str, size: int) -> int:
+    """
+    64-bit (unsigned) fingerprint of a content hash and size, used as the
+    unique key for content.
+
+    The leading 8 bytes of a hex digest are already uniformly distributed,
+    so they are taken as-is and XORed with the size; anything that isn't a
+    hex digest is hashed down to 8 bytes first.
+    """
+    try:
+        head = bytes.fromhex(hash_[:16])
+    except ValueError:
+        head = hashlib.blake2b(
+            hash_.encode("utf-8", "surrogatepass"), digest_size=8
+        ).digest()
+    return int.from_bytes(head, "big") ^ size
+
 
 class Base(DeclarativeBase):
     pass
@@ -43,47 +89,63 @@ class Content(Base):
 
     __tablename__ = "content"
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
 
-    algo: Mapped[str] = mapped_column(String(16), nullable=False)
+    algo: Mapped[str] = mapped_column(ENUM(*HASH_ALGOS), nullable=False)
     hash: Mapped[str] = mapped_column(String(128), nullable=False)
-    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    size: Mapped[int] = mapped_column(BIGINT(unsigned=True), nullable=False)
+
+    # content_fingerprint(hash, size), maintained by _set_content_fp
+    content_fp: Mapped[int] = mapped_column(BIGINT(unsigned=True), nullable=False)
 
     # Optional: logical vs disk size, compression info, etc. if you want later
     # fsize_du: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
 
-    created_at: Mapped[float] = mapped_column(
-        Float, nullable=False, default=lambda: time.time()
+    created_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(fsp=6), nullable=False, server_default=_NOW
     )
-    updated_at: Mapped[float] = mapped_column(
-        Float, nullable=False, default=lambda: time.time(), onupdate=time.time
+    updated_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(fsp=6),
+        nullable=False,
+        server_default=_NOW_ON_UPDATE,
+        server_onupdate=FetchedValue(),
     )
 
-    files: Mapped[list["File"]] = relationship(back_populates="content")
+    # Read-only collections throughout: only the to-one side is ever set, so
+    # there is no backref bookkeeping on every assignment. Deletes cascade
+    # through the ON DELETE foreign keys, not the ORM.
+    files: Mapped[list["File"]] = relationship(viewonly=True)
 
     __table_args__ = (
-        UniqueConstraint("algo", "hash", "size", name="uq_content_algo_hash_size"),
+        Index("uq_content_fp", "content_fp", unique=True),
         Index("ix_content_hash", "hash"),
     )
 
 
+@event.listens_for(Content, "before_insert")
+@event.listens_for(Content, "before_update")
+def _set_content_fp(mapper, connection, target: Content) -> None:
+    target.content_fp = content_fingerprint(target.hash, target.size)
+
+
 class File(Base):
     """Physical file object identified by (dev, inode)"""
 
     __tablename__ = "files"
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
 
-    # Physical identity (posix-ish)
-    dev: Mapped[int] = mapped_column(BigInteger, nullable=False)
-    inode: Mapped[int] = mapped_column(BigInteger, nullable=False)
-    nlinks: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # Physical identity (posix-ish). Stat fields are declared at their
+    # native unsigned widths so rows and the (dev, inode) key stay narrow.
+    dev: Mapped[int] = mapped_column(BIGINT(unsigned=True), nullable=False)
+    inode: Mapped[int] = mapped_column(BIGINT(unsigned=True), nullable=False)
+    nlinks: Mapped[Optional[int]] = mapped_column(INTEGER(unsigned=True), nullable=True)
 
     # Link to logical content
     content_id: Mapped[Optional[int]] = mapped_column(
-        Integer, ForeignKey("content.id", ondelete="SET NULL"), nullable=True
+        BigInteger, ForeignKey("content.id", ondelete="SET NULL"), nullable=True
     )
-    content: Mapped[Optional[Content]] = relationship(back_populates="files")
+    content: Mapped[Optional[Content]] = relationship()
 
     # Timestamps (epoch seconds)
     mtime: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
@@ -93,31 +155,30 @@ class File(Base):
     # Ownership / perms
     owner: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
     group: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
-    uid: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
-    gid: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
-    mode: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    uid: Mapped[Optional[int]] = mapped_column(INTEGER(unsigned=True), nullable=True)
+    gid: Mapped[Optional[int]] = mapped_column(INTEGER(unsigned=True), nullable=True)
+    mode: Mapped[Optional[int]] = mapped_column(SMALLINT(unsigned=True), nullable=True)
 
     # Type: "file", "dir", "symlink", etc.
-    type: Mapped[Optional[str]] = mapped_column(String(16), nullable=True)
+    type: Mapped[Optional[str]] = mapped_column(ENUM(*FILE_TYPES), nullable=True)
 
-    created_at: Mapped[float] = mapped_column(
-        Float, nullable=False, default=lambda: time.time()
+    created_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(fsp=6), nullable=False, server_default=_NOW
     )
-    updated_at: Mapped[float] = mapped_column(
-        Float, nullable=False, default=lambda: time.time(), onupdate=time.time
+    updated_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(fsp=6),
+        nullable=False,
+        server_default=_NOW_ON_UPDATE,
+        server_onupdate=FetchedValue(),
     )
 
-    paths: Mapped[list["PathEntry"]] = relationship(
-        back_populates="file",
-        cascade="all, delete-orphan",
-    )
-    snapshot_links: Mapped[list["SnapshotFile"]] = relationship(
-        back_populates="file",
-        cascade="all, delete-orphan",
-    )
+    paths: Mapped[list["PathEntry"]] = relationship(viewonly=True)
+    snapshot_links: Mapped[list["SnapshotFile"]] = relationship(viewonly=True)
 
     __table_args__ = (
         UniqueConstraint("dev", "inode", name="uq_files_dev_inode"),
+        # Already covering for Content -> files lookups: InnoDB appends the
+        # primary key to every secondary index, so this is (content_id, id).
         Index("ix_files_content_id", "content_id"),
     )
 
@@ -127,46 +188,63 @@ class PathEntry(Base):
 
     __tablename__ = "paths"
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
 
     file_id: Mapped[int] = mapped_column(
-        Integer, ForeignKey("files.id", ondelete="CASCADE"), nullable=False
+        BigInteger, ForeignKey("files.id", ondelete="CASCADE"), nullable=False
     )
-    file: Mapped[File] = relationship(back_populates="paths")
+    file: Mapped[File] = relationship()
 
-    # Full path and derived components
-    full_path: Mapped[str] = mapped_column(Text, nullable=False)
+    # Full path and derived components. The TEXT columns are deferred as a
+    # group so loads that only need ids/flags (e.g. SnapshotFile.path) don't
+    # pull them; use undefer_group("text") when they are needed.
+    full_path: Mapped[str] = mapped_column(
+        Text, nullable=False, deferred=True, deferred_group="text"
+    )
 
-    # TODO: add a path hash column to enforce uniqueness
-    # full_path_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    # Unique key for the path, see path_hash(); set automatically on flush
+    full_path_hash: Mapped[int] = mapped_column(BigInteger, nullable=False)
 
-    dir: Mapped[str] = mapped_column(Text, nullable=False)
+    dir: Mapped[str] = mapped_column(
+        Text, nullable=False, deferred=True, deferred_group="text"
+    )
     name: Mapped[str] = mapped_column(String(255), nullable=False)
     ext: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
 
     # Soft delete for "current view" of the tree
     is_deleted: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
 
-    created_at: Mapped[float] = mapped_column(
-        Float, nullable=False, default=lambda: time.time()
+    created_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(fsp=6), nullable=False, server_default=_NOW
     )
-    updated_at: Mapped[float] = mapped_column(
-        Float, nullable=False, default=lambda: time.time(), onupdate=time.time
+    updated_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(fsp=6),
+        nullable=False,
+        server_default=_NOW_ON_UPDATE,
+        server_onupdate=FetchedValue(),
     )
 
     __table_args__ = (
-        # Unique index on first 512 chars of full_path (MySQL quirk)
-        Index(
-            "uq_paths_full_path",
-            "full_path",
-            mysql_length=512,
-            unique=True,
-        ),
-        # Optional: index on dir; also TEXT, so add prefix
-        Index("ix_paths_dir", "dir", mysql_length=255),
+        Index("uq_paths_full_path_hash", "full_path_hash", unique=True),
+        # Directory listings: filter on dir, order by name. dir is TEXT, so
+        # it needs a prefix; name is a full VARCHAR key part so it can serve
+        # the ORDER BY.
+        Index("ix_paths_dir_name", "dir", "name", mysql_length={"dir": 255}),
     )
 
 
+@event.listens_for(PathEntry, "before_insert")
+def _set_full_path_hash(mapper, connection, target: PathEntry) -> None:
+    target.full_path_hash = path_hash(target.full_path)
+
+
+@event.listens_for(PathEntry, "before_update")
+def _update_full_path_hash(mapper, connection, target: PathEntry) -> None:
+    # Checking history doesn't load the deferred column
+    if inspect(target).attrs.full_path.history.has_changes():
+        target.full_path_hash = path_hash(target.full_path)
+
+
 class Snapshot(Base):
     """A logical snapshot of a scan run"""
 
@@ -180,14 +258,11 @@ class Snapshot(Base):
     # Optional label / description per run
     label: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
 
-    created_at: Mapped[float] = mapped_column(
-        Float, nullable=False, default=lambda: time.time()
+    created_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(fsp=6), nullable=False, server_default=_NOW
     )
 
-    files: Mapped[list["SnapshotFile"]] = relationship(
-        back_populates="snapshot",
-        cascade="all, delete-orphan",
-    )
+    files: Mapped[list["SnapshotFile"]] = relationship(viewonly=True)
 
 
 class SnapshotFile(Base):
@@ -195,28 +270,32 @@ class SnapshotFile(Base):
 
     __tablename__ = "snapshot_files"
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
 
     snapshot_id: Mapped[int] = mapped_column(
         Integer, ForeignKey("snapshots.id", ondelete="CASCADE"), nullable=False
     )
     file_id: Mapped[int] = mapped_column(
-        Integer, ForeignKey("files.id", ondelete="CASCADE"), nullable=False
+        BigInteger, ForeignKey("files.id", ondelete="CASCADE"), nullable=False
     )
     path_id: Mapped[int] = mapped_column(
-        Integer, ForeignKey("paths.id", ondelete="CASCADE"), nullable=False
+        BigInteger, ForeignKey("paths.id", ondelete="CASCADE"), nullable=False
     )
 
     # Size attributed to this snapshot membership. This can be logical
     # content size, or du-style size, depending on what you want to graph.
     size_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False)
 
-    snapshot: Mapped[Snapshot] = relationship(back_populates="files")
-    file: Mapped[File] = relationship(back_populates="snapshot_links")
-    path: Mapped[PathEntry] = relationship()
+    # Membership rows are almost always read together with their targets,
+    # so load the to-one side in the same query instead of one SELECT each.
+    # Collections stay lazy: they can be unbounded (a snapshot's files), so
+    # reporting code opts in per query with .options(selectinload(...)).
+    snapshot: Mapped[Snapshot] = relationship(lazy="joined")
+    file: Mapped[File] = relationship(lazy="joined")
+    path: Mapped[PathEntry] = relationship(lazy="joined")
 
-    created_at: Mapped[float] = mapped_column(
-        Float, nullable=False, default=lambda: time.time()
+    created_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(fsp=6), nullable=False, server_default=_NOW
     )
 
     __table_args__ = (
@@ -225,6 +304,6 @@ class SnapshotFile(Base):
             "path_id",
             name="uq_snapshot_files_snapshot_path",
         ),
-        Index("ix_snapshot_files_snapshot", "snapshot_id"),
+        # No separate snapshot_id index: the unique key above leads with it
         Index("ix_snapshot_files_file", "file_id"),
     )
@@ -14,13 +14,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import Any, Dict, List, Optional
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional
 
-from sqlalchemy import text
+from sqlalchemy import TextClause, text
 
 from .db import get_engine
 
 
+@lru_cache(maxsize=256)
+def _text(sql: str) -> TextClause:
+    """
+    Parse `sql` into a TextClause once per distinct string. Bounded, since
+    the SQL may come from gateway callers.
+    """
+    return text(sql)
+
+
 def run_sql(sql: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
     """
     Execute a raw SQL query and return a list of dict rows.
@@ -28,12 +38,29 @@ def run_sql(sql: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str,
     This is primarily intended for internal tooling and the /query/sql gateway endpoint.
     """
     engine = get_engine()
-    out: List[Dict[str, Any]] = []
 
     with engine.connect() as conn:
-        result = conn.execute(text(sql), params or {})
-        cols = result.keys()
-        for row in result:
-            out.append({col: row[idx] for idx, col in enumerate(cols)})
+        result = conn.execute(_text(sql), params or {})
+        return [dict(row) for row in result.mappings()]
+
 
-    return out
+def run_sql_stream(
+    sql: str,
+    params: Optional[Dict[str, Any]] = None,
+    chunk: int = 1000,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Execute a raw SQL query and yield its rows in lists of at most `chunk` dicts.
+
+    Rows are read through a server-side cursor, so memory stays bounded by
+    `chunk` however large the result is. Use this instead of run_sql for
+    unbounded queries that are streamed back to the client.
+    """
+    engine = get_engine()
+
+    with engine.connect() as conn:
+        result = conn.execution_options(
+            stream_results=True, max_row_buffer=chunk
+        ).execute(_text(sql), params or {})
+        for part in result.mappings().partitions(chunk):
+            yield [dict(row) for row in part]
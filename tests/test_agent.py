@@ -0,0 +1,22 @@
+import inspect
+import json
+
+from snapfs_agent_mysql import agent
+from snapfs_agent_mysql.agent import _ack_frame, ws_loop
+
+
+def test_ws_loop_is_single_coroutine():
+    assert agent.__all__ == ["ws_loop"]
+    assert inspect.iscoroutinefunction(ws_loop)
+
+
+def test_ack_frame_int_batch():
+    frame = _ack_frame(42)
+    assert frame == '{"type":"ack","batch":42}'
+    assert json.loads(frame) == {"type": "ack", "batch": 42}
+
+
+def test_ack_frame_non_int_batch():
+    assert json.loads(_ack_frame("b-7")) == {"type": "ack", "batch": "b-7"}
+    # bool is an int subclass but must still be encoded as JSON true
+    assert json.loads(_ack_frame(True)) == {"type": "ack", "batch": True}
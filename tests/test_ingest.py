@@ -0,0 +1,83 @@
+import pytest
+
+from snapfs_agent_mysql.ingest import (
+    _FILE_OPTIONAL_COLS,
+    _file_row,
+    _path_row,
+    _split_ext,
+    _split_path,
+)
+from snapfs_agent_mysql.models import path_hash
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    [
+        ("", ("/", "")),
+        ("a.txt", ("/", "a.txt")),
+        ("/a.txt", ("/", "a.txt")),
+        ("/data/dir/a.txt", ("/data/dir", "a.txt")),
+        ("C:\\data\\a.txt", ("C:/data", "a.txt")),
+    ],
+)
+def test_split_path(path, expected):
+    assert _split_path(path) == expected
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("", None),
+        ("README", None),
+        (".gitignore", None),
+        ("foo.", None),
+        ("a.txt", "txt"),
+        ("archive.tar.gz", "gz"),
+        ("dir/sub\\a.py", "py"),
+    ],
+)
+def test_split_ext(name, expected):
+    assert _split_ext(name) == expected
+
+
+def test_file_row_defaults():
+    row = _file_row({}, 1, 2)
+    assert row["dev"] == 1
+    assert row["inode"] == 2
+    assert row["content_id"] is None
+    assert row["mtime"] == 0.0
+    assert row["type"] == "file"
+    assert all(row[col] is None for col in _FILE_OPTIONAL_COLS)
+
+
+def test_file_row_passes_values_through():
+    data = {"mtime": 1.5, "type": "symlink", "uid": 7, "mode": 0o100644}
+    row = _file_row(data, 1, 2)
+    assert row["mtime"] == 1.5
+    assert row["type"] == "symlink"
+    assert row["uid"] == 7
+    assert row["mode"] == 0o100644
+
+
+def test_file_row_unknown_type():
+    assert _file_row({"type": "door"}, 1, 2)["type"] == "unknown"
+
+
+def test_path_row_splits_path():
+    row = _path_row({}, "/data/a.tar.gz")
+    assert row == {
+        "file_id": None,
+        "full_path": "/data/a.tar.gz",
+        "full_path_hash": path_hash("/data/a.tar.gz"),
+        "dir": "/data",
+        "name": "a.tar.gz",
+        "ext": "gz",
+        "is_deleted": False,
+    }
+
+
+def test_path_row_prefers_scanner_dir_and_name():
+    data = {"dir": "/mnt/data", "name": "b.TXT", "is_deleted": 1}
+    row = _path_row(data, "/data/b.TXT")
+    assert (row["dir"], row["name"], row["ext"]) == ("/mnt/data", "b.TXT", "TXT")
+    assert row["is_deleted"] is True
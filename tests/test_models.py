@@ -0,0 +1,23 @@
+from snapfs_agent_mysql.models import content_fingerprint, path_hash
+
+
+def test_path_hash_is_signed_64_bit_and_stable():
+    h = path_hash("/data/projects/a.txt")
+    assert -(2**63) <= h < 2**63
+    assert h == path_hash("/data/projects/a.txt")
+    assert h != path_hash("/data/projects/b.txt")
+
+
+def test_content_fingerprint_hex_digest():
+    digest = "0123456789abcdef" + "0" * 48
+    assert content_fingerprint(digest, 0) == 0x0123456789ABCDEF
+    assert content_fingerprint(digest, 5) == 0x0123456789ABCDEF ^ 5
+    # Case of a hex digest doesn't matter
+    assert content_fingerprint(digest.upper(), 5) == content_fingerprint(digest, 5)
+
+
+def test_content_fingerprint_non_hex_is_unsigned_64_bit():
+    fp = content_fingerprint("not-a-hex-digest", 10)
+    assert 0 <= fp < 2**64
+    assert fp == content_fingerprint("not-a-hex-digest", 10)
+    assert fp != content_fingerprint("not-a-hex-digest", 11)